@@ -2,31 +2,132 @@
 Conversation manager for the A2 Discord bot.
 """
 import re
-from datetime import datetime, timezone
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice
 
 from models.user_profile import UserProfile
+from models.utils import utcnow_iso
+
+# Profile extraction patterns, one capturing group each
+INTEREST_PATTERNS = (
+    r"I (?:like|love|enjoy) (\w+ing)",
+    r"I'm (?:interested in|passionate about) ([^.,]+)",
+    r"favorite (?:hobby|activity) is ([^.,]+)"
+)
+
+FACT_PATTERNS = (
+    r"I (?:work as|am) an? ([^.,]+)",
+    r"I live in ([^.,]+)",
+    r"I'm from ([^.,]+)",
+    r"I've been ([^.,]+)"
+)
+
+NAME_PATTERNS = (
+    r"my name(?:'s| is) ([^.,]+)",
+    r"call me ([^.,]+)",
+    r"I go by ([^.,]+)"
+)
+
+# All patterns fused into a single alternation so each message is scanned once.
+# The alternation sits in a lookahead so matches of different patterns can still
+# overlap, as they did when each pattern was searched separately.
+ALL_PATTERNS = INTEREST_PATTERNS + FACT_PATTERNS + NAME_PATTERNS
+GROUP_KIND = (
+    ("interest",) * len(INTEREST_PATTERNS)
+    + ("fact",) * len(FACT_PATTERNS)
+    + ("name", "nickname", "name")  # "call me" gives a nickname
+)
+MASTER_RE = re.compile(
+    "(?=" + "|".join(f"(?P<g{i}>{p})" for i, p in enumerate(ALL_PATTERNS)) + ")",
+    re.I
+)
+
+# Personality traits are matched on words rather than with regexes: a trait is
+# recognised after "I am", "I'm" or "I consider myself" plus an optional intensifier.
+# Apostrophes and hyphens only count inside a word, so quotes around it are dropped.
+WORD_RE = re.compile(r"[a-z]+(?:['-][a-z]+)*")
+TRAIT_INTENSIFIERS = frozenset({"quite", "very", "extremely", "really"})
+
+PERSONALITY_TRAITS = frozenset({
+    "shy", "outgoing", "confident", "anxious", "creative", "logical",
+    "hardworking", "laid-back", "organized", "spontaneous", "sensitive",
+    "resilient", "introverted", "extroverted", "curious", "cautious"
+})
+
+# Upper bound on summarizer input, in tokens
+SUMMARY_MAX_TOKENS = 512
+
+# Common long words that don't make useful summary topics
+STOPWORDS = frozenset({
+    "about", "would", "could", "should", "their", "there", "these", "those", "have", "being"
+})
+
+def truncate_for_summarizer(conversation_text, summarizer):
+    """Trim text to the summarizer's input limit, keeping the most recent part"""
+    tokenizer = getattr(summarizer, "tokenizer", None)
+    if tokenizer is None:
+        return conversation_text[-1000:]
+    
+    max_tokens = min(tokenizer.model_max_length, SUMMARY_MAX_TOKENS)
+    ids = tokenizer(conversation_text, add_special_tokens=False)["input_ids"]
+    if len(ids) > max_tokens:
+        return tokenizer.decode(ids[-max_tokens:], skip_special_tokens=True)
+    return conversation_text
+
+def topic_summary(recent_msgs):
+    """Summarize messages by a few of their longer words"""
+    # Extract key topics with simple pattern matching
+    topics = {
+        word
+        for msg in recent_msgs
+        for word in msg["content"].lower().split()
+        if len(word) > 4 and word not in STOPWORDS
+    }
+    
+    if topics:
+        return f"Recent conversation about: {', '.join(islice(topics, 3))}."
+    return "Brief conversation with no clear topic."
+
+def find_traits(lowered):
+    """Yield known personality traits the user ascribes to themselves in lowercased text"""
+    words = WORD_RE.findall(lowered)
+    count = len(words)
+    for i, word in enumerate(words):
+        if word == "i'm":
+            j = i + 1
+        elif word != "i" or i + 1 >= count:
+            continue
+        elif words[i + 1] == "am":
+            j = i + 2
+        elif words[i + 1] == "consider" and i + 2 < count and words[i + 2] == "myself":
+            j = i + 3
+        else:
+            continue
+        
+        if j < count and words[j] in TRAIT_INTENSIFIERS:
+            j += 1
+        if j < count and words[j] in PERSONALITY_TRAITS:
+            yield words[j]
 
 class ConversationManager:
     """Manages conversation history and generates summaries"""
     
     def __init__(self):
-        self.conversations = defaultdict(list)  # user_id -> list of messages
-        self.conversation_summaries = {}  # user_id -> summary string
         self.MAX_HISTORY = 10  # Number of messages to remember
+        # user_id -> deque of messages, oldest evicted once MAX_HISTORY is reached
+        self.conversations = defaultdict(lambda: deque(maxlen=self.MAX_HISTORY))
+        self.conversation_summaries = {}  # user_id -> summary string
         self.user_profiles = {}  # user_id -> UserProfile
+        self.summary_cache = OrderedDict()  # conversation text -> model summary, oldest first
+        self.SUMMARY_CACHE_SIZE = 256  # Number of model summaries to remember
     
     def add_message(self, user_id, content, is_from_bot=False):
         """Add a message to the conversation history"""
         self.conversations[user_id].append({
             "content": content,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": utcnow_iso(),
             "from_bot": is_from_bot
         })
-        
-        # Keep only the last MAX_HISTORY messages
-        if len(self.conversations[user_id]) > self.MAX_HISTORY:
-            self.conversations[user_id] = self.conversations[user_id][-self.MAX_HISTORY:]
     
     def get_conversation_history(self, user_id):
         """Get formatted conversation history"""
@@ -60,130 +161,166 @@ class ConversationManager:
         if preferred_name:
             profile.preferred_name = preferred_name
         
-        profile.updated_at = datetime.now(timezone.utc).isoformat()
+        profile.updated_at = utcnow_iso()
         return profile
     
     def extract_profile_info(self, user_id, message_content):
         """Extract profile information from message content"""
         profile = self.get_or_create_profile(user_id)
+        lowered = message_content.lower()
         
-        # Extract interests
-        interest_patterns = [
-            r"I (?:like|love|enjoy) (\w+ing)",
-            r"I'm (?:interested in|passionate about) ([^.,]+)",
-            r"favorite (?:hobby|activity) is ([^.,]+)"
-        ]
-        
-        for pattern in interest_patterns:
-            matches = re.finditer(pattern, message_content, re.I)
-            for match in matches:
-                interest = match.group(1).strip().lower()
-                if interest and interest not in profile.interests:
-                    profile.interests.append(interest)
-        
-        # Extract personality traits
-        trait_patterns = [
-            r"I am (?:quite |very |extremely |really |)(\w+)",
-            r"I'm (?:quite |very |extremely |really |)(\w+)",
-            r"I consider myself (?:quite |very |extremely |really |)(\w+)"
-        ]
-        
-        personality_traits = [
-            "shy", "outgoing", "confident", "anxious", "creative", "logical", 
-            "hardworking", "laid-back", "organized", "spontaneous", "sensitive",
-            "resilient", "introverted", "extroverted", "curious", "cautious"
-        ]
-        
-        for pattern in trait_patterns:
-            matches = re.finditer(pattern, message_content, re.I)
-            for match in matches:
-                trait = match.group(1).strip().lower()
-                if trait in personality_traits and trait not in profile.personality_traits:
-                    profile.personality_traits.append(trait)
-        
-        # Extract facts
-        fact_patterns = [
-            r"I (?:work as|am) an? ([^.,]+)",
-            r"I live in ([^.,]+)",
-            r"I'm from ([^.,]+)",
-            r"I've been ([^.,]+)"
-        ]
-        
-        for pattern in fact_patterns:
-            matches = re.finditer(pattern, message_content, re.I)
-            for match in matches:
-                fact = match.group(0).strip()
-                if fact and fact not in profile.notable_facts:
-                    profile.notable_facts.append(fact)
-        
-        # Extract name references
-        name_patterns = [
-            r"my name(?:'s| is) ([^.,]+)",
-            r"call me ([^.,]+)",
-            r"I go by ([^.,]+)"
-        ]
-        
-        for pattern in name_patterns:
-            match = re.search(pattern, message_content, re.I)
-            if match:
-                name_value = match.group(1).strip()
-                if "nickname" in message_content.lower() or "call me" in message_content.lower():
-                    profile.nickname = name_value
-                else:
-                    profile.name = name_value
+        known_interests = set(profile.interests)
+        known_traits = set(profile.personality_traits)
+        known_facts = set(profile.notable_facts)
+        name_values = {}  # pattern index -> first captured name
+        last_end = [0] * len(ALL_PATTERNS)
+        
+        # New interests and facts are appended in the order they appear in
+        # the message, not grouped by which pattern matched them
+        for match in MASTER_RE.finditer(message_content):
+            index = int(match.lastgroup[1:])
+            group = match.lastindex
+            
+            # Skip matches overlapping an earlier match of the same pattern
+            if match.start(group) < last_end[index]:
+                continue
+            last_end[index] = match.end(group)
+            
+            kind = GROUP_KIND[index]
+            if kind == "interest":
+                interest = match.group(group + 1).strip().lower()
+                if interest and interest not in known_interests:
+                    known_interests.add(interest)
+                    profile.append_to("interests", interest)
+            elif kind == "fact":
+                fact = match.group(group).strip()
+                if fact and fact not in known_facts:
+                    known_facts.add(fact)
+                    profile.append_to("notable_facts", fact)
+            elif index not in name_values:
+                name_values[index] = match.group(group + 1).strip()
+        
+        # Apply name references in pattern order so later patterns take precedence.
+        # "call me X" gives a nickname, as does any name in a message about nicknames.
+        for index in sorted(name_values):
+            if GROUP_KIND[index] == "nickname" or "nickname" in lowered:
+                profile.nickname = name_values[index]
+            else:
+                profile.name = name_values[index]
+        
+        for trait in find_traits(lowered):
+            if trait not in known_traits:
+                known_traits.add(trait)
+                profile.append_to("personality_traits", trait)
         
-        profile.updated_at = datetime.now(timezone.utc).isoformat()
+        profile.updated_at = utcnow_iso()
         return profile
     
-    def generate_summary(self, user_id, transformer_helper=None):
-        """Generate a summary of the conversation"""
-        if user_id not in self.conversations or len(self.conversations[user_id]) < 3:
-            return "Not enough conversation history for a summary."
-        
-        # Get last few messages
-        recent_msgs = self.conversations[user_id][-5:]
+    def get_recent_conversation(self, user_id):
+        """Get the last few messages and their formatted text for summarizing"""
+        history = self.conversations[user_id]
+        recent_msgs = list(islice(history, max(len(history) - 5, 0), None))
         
-        # Format for summary generation
         conversation_text = "\n".join([
             f"{'A2' if msg['from_bot'] else 'User'}: {msg['content']}"
             for msg in recent_msgs
         ])
+        return recent_msgs, conversation_text
+    
+    def cache_summary(self, conversation_text, summary):
+        """Remember a model summary, evicting the least recently used one"""
+        self.summary_cache[conversation_text] = summary
+        if len(self.summary_cache) > self.SUMMARY_CACHE_SIZE:
+            self.summary_cache.popitem(last=False)
+    
+    def get_cached_summary(self, conversation_text):
+        """Get a previous model summary of this exact conversation, if any"""
+        summary = self.summary_cache.get(conversation_text)
+        if summary is not None:
+            self.summary_cache.move_to_end(conversation_text)
+        return summary
+    
+    def generate_summary(self, user_id, transformer_helper=None):
+        """Generate a summary of the conversation"""
+        if user_id not in self.conversations or len(self.conversations[user_id]) < 3:
+            return "Not enough conversation history for a summary."
         
+        recent_msgs, conversation_text = self.get_recent_conversation(user_id)
         summary = ""
         
         # Try using transformers if available
         if transformer_helper and transformer_helper.HAVE_TRANSFORMERS and transformer_helper.get_summarizer():
             try:
-                # Limit to manageable size for the model
-                if len(conversation_text) > 1000:
-                    conversation_text = conversation_text[-1000:]
-                    
-                result = transformer_helper.get_summarizer()(conversation_text, max_length=50, min_length=10, do_sample=False)
-                if result and len(result) > 0:
-                    summary = result[0]['summary_text']
+                # Reuse the summary if this exact conversation was summarized before
+                summary = self.get_cached_summary(conversation_text)
+                if summary is None:
+                    summary = ""
+                    summarizer = transformer_helper.get_summarizer()
+                    result = summarizer(truncate_for_summarizer(conversation_text, summarizer),
+                                        max_length=50, min_length=10, truncation=True, do_sample=False)
+                    if result and len(result) > 0:
+                        summary = result[0]['summary_text']
+                        self.cache_summary(conversation_text, summary)
             except Exception as e:
                 print(f"Error generating summary: {e}")
         
         # Fallback to a simpler approach
         if not summary:
-            # Extract key topics with simple pattern matching
-            topics = set()
-            for msg in recent_msgs:
-                # Find nouns and noun phrases (simple approach)
-                content = msg["content"].lower()
-                words = content.split()
-                for word in words:
-                    if len(word) > 4 and word not in ["about", "would", "could", "should", "their", "there", "these", "those", "have", "being"]:
-                        topics.add(word)
-            
-            if topics:
-                summary = f"Recent conversation about: {', '.join(list(topics)[:3])}."
-            else:
-                summary = "Brief conversation with no clear topic."
+            summary = topic_summary(recent_msgs)
         
         self.conversation_summaries[user_id] = summary
         return summary
     
+    def generate_summaries_bulk(self, user_ids, transformer_helper=None, batch_size=8):
+        """Generate conversation summaries for several users at once.
+        
+        Conversations that need the model are summarized in a single batched
+        pipeline call. Returns a dict of user_id -> summary.
+        """
+        summaries = {}
+        pending = []  # (user_id, conversation_text) awaiting the model
+        recent = {}  # user_id -> recent messages, for the fallback
+        
+        use_model = transformer_helper and transformer_helper.HAVE_TRANSFORMERS and transformer_helper.get_summarizer()
+        
+        for user_id in user_ids:
+            if user_id not in self.conversations or len(self.conversations[user_id]) < 3:
+                summaries[user_id] = "Not enough conversation history for a summary."
+                continue
+            
+            recent[user_id], conversation_text = self.get_recent_conversation(user_id)
+            if use_model:
+                summary = self.get_cached_summary(conversation_text)
+                if summary is None:
+                    pending.append((user_id, conversation_text))
+                else:
+                    summaries[user_id] = summary
+        
+        if pending:
+            try:
+                summarizer = transformer_helper.get_summarizer()
+                inputs = [truncate_for_summarizer(text, summarizer) for _, text in pending]
+                results = summarizer(inputs, max_length=50, min_length=10, truncation=True,
+                                     do_sample=False, batch_size=batch_size)
+                for (user_id, conversation_text), result in zip(pending, results):
+                    # Pipelines may wrap each result in a list
+                    if isinstance(result, list):
+                        result = result[0] if result else {}
+                    summary = result.get('summary_text', "")
+                    if summary:
+                        summaries[user_id] = summary
+                        self.cache_summary(conversation_text, summary)
+            except Exception as e:
+                print(f"Error generating summaries: {e}")
+        
+        # Fallback to a simpler approach for anything the model didn't cover
+        for user_id, recent_msgs in recent.items():
+            if not summaries.get(user_id):
+                summaries[user_id] = topic_summary(recent_msgs)
+            self.conversation_summaries[user_id] = summaries[user_id]
+        
+        return summaries
+    
     def get_preferred_name(self, user_id):
         """Get the preferred name for a user"""
         if user_id in self.user_profiles:
@@ -1,12 +1,107 @@
 """
 Storage manager for the A2 Discord bot.
 """
+import os
 import json
 import asyncio
-from datetime import datetime, timezone
-from collections import Counter
+import hashlib
+import secrets
+from collections import Counter, OrderedDict, defaultdict, deque
 from pathlib import Path
 
+from models.user_profile import UserProfile
+from models.utils import utcnow_iso
+
+# Use orjson for (de)serialization if available
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
+
+# Payloads larger than this are parsed in a worker thread
+LARGE_PAYLOAD_SIZE = 64 * 1024
+
+# Number of most recently written files kept in memory to serve reloads
+MIRRORED_FILES = 128
+
+def dump_json(data, indent=True):
+    """Serialize data to UTF-8 encoded JSON bytes"""
+    if HAVE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, indent=2 if indent else None).encode("utf-8")
+
+def load_json(content):
+    """Parse JSON from a string or bytes"""
+    if HAVE_ORJSON:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def read_text(path):
+    """Read a UTF-8 text file"""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def file_signature(st):
+    """Modification time and size from a stat result, to tell if a file changed"""
+    return st.st_mtime_ns, st.st_size
+
+# Flags for creating a temporary file; O_BINARY stops newline translation on Windows
+TEMP_FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+
+def create_temp_file(path, temp_suffix):
+    """Create a new, uniquely named file next to path, returning (fd, temp_path).
+    
+    The file is created with mode 0o666 less the umask, like any other new file.
+    """
+    while True:
+        temp_path = path.with_name(f"{path.stem}.{secrets.token_hex(4)}{temp_suffix}")
+        try:
+            return os.open(temp_path, TEMP_FILE_FLAGS, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def write_atomic(path, data_bytes, temp_suffix='.tmp'):
+    """Durably write bytes to a temporary file, then rename it over path.
+    
+    Each call gets its own temporary file, so overlapping saves of the same
+    path can't truncate or rename each other's data. Returns the signature
+    of the written file.
+    """
+    fd, temp_path = create_temp_file(path, temp_suffix)
+    try:
+        try:
+            view = memoryview(data_bytes)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+            signature = file_signature(os.fstat(fd))
+        finally:
+            os.close(fd)
+        
+        # Use atomic rename operation
+        os.replace(temp_path, path)
+        return signature
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def json_entries(dir_path, suffix):
+    """List directory entries for files whose name ends with suffix"""
+    with os.scandir(dir_path) as it:
+        return [entry for entry in it if entry.name.endswith(suffix) and entry.is_file()]
+
+def parse_user_id(file_name):
+    """Get the user id from a data file name like 123.json or 123_memories.json"""
+    underscore = file_name.find("_")
+    return int(file_name[:underscore] if underscore >= 0 else file_name[:-len(".json")])
+
 class StorageManager:
     """Handles all data persistence operations"""
     
@@ -18,6 +113,23 @@ class StorageManager:
         self.user_profiles_dir = user_profiles_dir
         self.conversations_dir = conversations_dir
         
+        # Bounds the number of files open at once during concurrent I/O
+        self.io_semaphore = asyncio.Semaphore(64)
+        
+        # path -> digest of the content last written there, to skip unchanged rewrites
+        self.file_hashes = {}
+        
+        # path -> (file signature, bytes) for the most recently written files,
+        # oldest first, to serve reloads of files unchanged since without disk reads
+        self.written_files = OrderedDict()
+        
+        # user_id -> (summary, updated_at) as last saved or loaded, so a
+        # summary's timestamp only moves when its text changes
+        self.summary_times = {}
+        
+        # Set once verify_data_directories has succeeded
+        self.dirs_verified = False
+        
         # Ensure directories exist
         self.profiles_dir.mkdir(parents=True, exist_ok=True)
         self.user_profiles_dir.mkdir(parents=True, exist_ok=True)
@@ -25,52 +137,27 @@ class StorageManager:
         
     def verify_data_directories(self):
         """Ensure all required data directories exist and are writable"""
+        if self.dirs_verified:
+            return True
+        
         print(f"Data directory: {self.data_dir}")
         print(f"Directory exists: {self.data_dir.exists()}")
         
-        # Check data directory
-        if not self.data_dir.exists():
-            try:
-                self.data_dir.mkdir(parents=True, exist_ok=True)
-                print(f"Created data directory: {self.data_dir}")
-            except Exception as e:
-                print(f"ERROR: Failed to create data directory: {e}")
-                return False
-        
-        # Check users directory
-        if not self.users_dir.exists():
-            try:
-                self.users_dir.mkdir(parents=True, exist_ok=True)
-                print(f"Created users directory: {self.users_dir}")
-            except Exception as e:
-                print(f"ERROR: Failed to create users directory: {e}")
-                return False
-        
-        # Check profiles directory
-        if not self.profiles_dir.exists():
+        for directory, label in (
+            (self.data_dir, "data"),
+            (self.users_dir, "users"),
+            (self.profiles_dir, "profiles"),
+            (self.user_profiles_dir, "user profiles"),
+            (self.conversations_dir, "conversations")
+        ):
+            # A single mkdir both checks for and creates the directory
             try:
-                self.profiles_dir.mkdir(parents=True, exist_ok=True)
-                print(f"Created profiles directory: {self.profiles_dir}")
+                directory.mkdir(parents=True)
+                print(f"Created {label} directory: {directory}")
+            except FileExistsError:
+                pass
             except Exception as e:
-                print(f"ERROR: Failed to create profiles directory: {e}")
-                return False
-        
-        # Check user profiles directory
-        if not self.user_profiles_dir.exists():
-            try:
-                self.user_profiles_dir.mkdir(parents=True, exist_ok=True)
-                print(f"Created user profiles directory: {self.user_profiles_dir}")
-            except Exception as e:
-                print(f"ERROR: Failed to create user profiles directory: {e}")
-                return False
-        
-        # Check conversations directory
-        if not self.conversations_dir.exists():
-            try:
-                self.conversations_dir.mkdir(parents=True, exist_ok=True)
-                print(f"Created conversations directory: {self.conversations_dir}")
-            except Exception as e:
-                print(f"ERROR: Failed to create conversations directory: {e}")
+                print(f"ERROR: Failed to create {label} directory: {e}")
                 return False
         
         # Check write access
@@ -83,23 +170,90 @@ class StorageManager:
             print(f"ERROR: Failed to verify write access: {e}")
             return False
         
+        self.dirs_verified = True
         return True
         
-    async def save_file(self, path, data, temp_suffix='.tmp'):
+    async def save_file(self, path, data, temp_suffix='.tmp', indent=True):
         """Helper function to safely save a file using atomic write"""
         try:
-            # Create a temporary file
-            temp_path = path.with_suffix(temp_suffix)
-            temp_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+            # Serialize on the event loop: the data is live state that other
+            # tasks may modify, so it can't be handed to a worker thread
+            data_bytes = dump_json(data, indent)
             
-            # Use atomic rename operation
-            if temp_path.exists():
-                temp_path.replace(path)
+            # Skip the write if the file still holds this content
+            digest = hashlib.blake2b(data_bytes, digest_size=16).digest()
+            if self.file_hashes.get(path) == digest and path.exists():
                 return True
+            
+            async with self.io_semaphore:
+                signature = await asyncio.to_thread(write_atomic, path, data_bytes, temp_suffix)
+            self.file_hashes[path] = digest
+            self.remember_file(path, signature, data_bytes)
+            return True
         except Exception as e:
             print(f"Error saving file {path}: {e}")
         return False
         
+    def remember_file(self, path, signature, data_bytes):
+        """Keep written content in memory, evicting the least recently used file"""
+        self.written_files[path] = (signature, data_bytes)
+        self.written_files.move_to_end(path)
+        if len(self.written_files) > MIRRORED_FILES:
+            self.written_files.popitem(last=False)
+    
+    def read_data_file(self, path):
+        """Get a file's content, from memory if it is unchanged since this manager wrote it"""
+        mirrored = self.written_files.get(path)
+        if mirrored is not None and mirrored[0] == file_signature(os.stat(path)):
+            self.written_files.move_to_end(path)
+            return mirrored[1]
+        return path.read_text(encoding="utf-8")
+    
+    async def parse_json(self, content):
+        """Parse JSON content, in a worker thread if the payload is large"""
+        if len(content) > LARGE_PAYLOAD_SIZE:
+            return await asyncio.to_thread(load_json, content)
+        return load_json(content)
+    
+    async def read_file(self, path):
+        """Read a text file in a worker thread so the event loop isn't blocked"""
+        async with self.io_semaphore:
+            return await asyncio.to_thread(read_text, path)
+    
+    async def read_files(self, paths):
+        """Read several files concurrently, returning (path, content) pairs.
+        
+        Paths may be path-like or os.DirEntry objects. Content is the raised
+        exception for files that could not be read.
+        """
+        paths = list(paths)
+        contents = await asyncio.gather(*(self.read_file(p) for p in paths), return_exceptions=True)
+        return list(zip(paths, contents))
+        
+    async def load_bucket(self, entries, assign, label):
+        """Load a set of per-user JSON files.
+        
+        Calls assign(user_id, data) for each non-empty file and returns
+        a (loaded, errors) count pair.
+        """
+        count = 0
+        error_count = 0
+        for entry, file_content in await self.read_files(entries):
+            try:
+                if isinstance(file_content, Exception):
+                    raise file_content
+                uid = parse_user_id(entry.name)
+                if not file_content.strip():
+                    print(f"Warning: Empty file {entry.path}")
+                    continue
+                    
+                assign(uid, await self.parse_json(file_content))
+                count += 1
+            except Exception as e:
+                error_count += 1
+                print(f"Error loading {label} {entry.path}: {e}")
+        return count, error_count
+        
     async def load_user_profile(self, user_id, emotion_manager):
         """Load user profile data with enhanced stats and error handling"""
         profile_path = self.profiles_dir / f"{user_id}.json"
@@ -107,12 +261,12 @@ class StorageManager:
         # Load main profile
         if profile_path.exists():
             try:
-                file_content = profile_path.read_text(encoding="utf-8")
+                file_content = self.read_data_file(profile_path)
                 if not file_content.strip():
                     print(f"Warning: Empty profile file for user {user_id}")
                     return {}
                     
-                data = json.loads(file_content)
+                data = await self.parse_json(file_content)
                 print(f"Successfully loaded profile for user {user_id}")
                 
                 # Extract relationship data if present
@@ -142,7 +296,8 @@ class StorageManager:
             
             # Add extra data
             data["relationship"] = emotion_manager.relationship_progress.get(user_id, {})
-            data["interaction_stats"] = dict(emotion_manager.interaction_stats.get(user_id, Counter()))
+            # Counter is a dict subclass, so it serializes as-is without a copy
+            data["interaction_stats"] = emotion_manager.interaction_stats.get(user_id, Counter())
             
             # Save main profile
             success = await self.save_file(path, data)
@@ -178,20 +333,31 @@ class StorageManager:
     async def save_conversation(self, user_id, conversation_manager):
         """Save conversation history and summary"""
         try:
+            success = True
+            
             # Save conversation history
             if user_id in conversation_manager.conversations:
                 conv_path = self.conversations_dir / f"{user_id}_conversations.json"
-                await self.save_file(conv_path, conversation_manager.conversations[user_id])
+                # History is rewritten often, so skip indentation to keep it small
+                conv_success = await self.save_file(
+                    conv_path, list(conversation_manager.conversations[user_id]), indent=False)
+                success = success and conv_success
                 
             # Save conversation summary
             if user_id in conversation_manager.conversation_summaries:
                 summary_path = self.conversations_dir / f"{user_id}_summary.json"
-                await self.save_file(summary_path, {
-                    "summary": conversation_manager.conversation_summaries[user_id],
-                    "updated_at": datetime.now(timezone.utc).isoformat()
+                summary = conversation_manager.conversation_summaries[user_id]
+                saved = self.summary_times.get(user_id)
+                updated_at = saved[1] if saved and saved[0] == summary else utcnow_iso()
+                summary_success = await self.save_file(summary_path, {
+                    "summary": summary,
+                    "updated_at": updated_at
                 })
+                if summary_success:
+                    self.summary_times[user_id] = (summary, updated_at)
+                success = success and summary_success
                 
-            return True
+            return success
         except Exception as e:
             print(f"Error saving conversation for user {user_id}: {e}")
             return False
@@ -202,17 +368,19 @@ class StorageManager:
             # Load conversation history
             conv_path = self.conversations_dir / f"{user_id}_conversations.json"
             if conv_path.exists():
-                file_content = conv_path.read_text(encoding="utf-8")
+                file_content = self.read_data_file(conv_path)
                 if file_content.strip():
-                    conversation_manager.conversations[user_id] = json.loads(file_content)
+                    conversation_manager.conversations[user_id] = deque(
+                        await self.parse_json(file_content), maxlen=conversation_manager.MAX_HISTORY)
             
             # Load conversation summary
             summary_path = self.conversations_dir / f"{user_id}_summary.json"
             if summary_path.exists():
-                file_content = summary_path.read_text(encoding="utf-8")
+                file_content = self.read_data_file(summary_path)
                 if file_content.strip():
-                    data = json.loads(file_content)
+                    data = await self.parse_json(file_content)
                     conversation_manager.conversation_summaries[user_id] = data.get("summary", "")
+                    self.remember_summary_time(user_id, data)
             
             return True
         except Exception as e:
@@ -223,22 +391,25 @@ class StorageManager:
         """Save user profile data"""
         try:
             profile_path = self.user_profiles_dir / f"{user_id}_profile.json"
-            await self.save_file(profile_path, profile.to_dict())
-            return True
+            return await self.save_file(profile_path, profile.to_dict())
         except Exception as e:
             print(f"Error saving user profile for {user_id}: {e}")
             return False
     
+    def remember_summary_time(self, user_id, data):
+        """Record a loaded summary's timestamp so an unchanged summary keeps it"""
+        if "updated_at" in data:
+            self.summary_times[user_id] = (data.get("summary", ""), data["updated_at"])
+    
     async def load_user_profile_data(self, user_id, conversation_manager):
         """Load user profile data"""
         try:
             profile_path = self.user_profiles_dir / f"{user_id}_profile.json"
             if profile_path.exists():
-                file_content = profile_path.read_text(encoding="utf-8")
+                file_content = self.read_data_file(profile_path)
                 if file_content.strip():
-                    data = json.loads(file_content)
-                    profile = conversation_manager.user_profiles[user_id].__class__.from_dict(data)
-                    conversation_manager.user_profiles[user_id] = profile
+                    data = await self.parse_json(file_content)
+                    conversation_manager.user_profiles[user_id] = UserProfile.from_dict(data)
                     return True
             return False
         except Exception as e:
@@ -250,9 +421,9 @@ class StorageManager:
         dm_enabled_users = set()
         try:
             if self.dm_settings_file.exists():
-                file_content = self.dm_settings_file.read_text(encoding="utf-8")
+                file_content = self.read_data_file(self.dm_settings_file)
                 if file_content.strip():
-                    data = json.loads(file_content)
+                    data = await self.parse_json(file_content)
                     dm_enabled_users = set(data.get('enabled_users', []))
                     print(f"Loaded DM settings for {len(dm_enabled_users)} users")
                 else:
@@ -269,27 +440,31 @@ class StorageManager:
     
     async def save_data(self, emotion_manager, conversation_manager=None):
         """Save all emotional and conversation data"""
-        success = True
+        tasks = []
         
         # Save emotional data for all users
         for user_id in emotion_manager.user_emotions:
-            profile_success = await self.save_user_profile(user_id, emotion_manager)
-            success = success and profile_success
+            tasks.append(self.save_user_profile(user_id, emotion_manager))
             
             # Save conversation data if provided
             if conversation_manager and user_id in conversation_manager.conversations:
-                conv_success = await self.save_conversation(user_id, conversation_manager)
-                success = success and conv_success
+                tasks.append(self.save_conversation(user_id, conversation_manager))
                 
                 # Save user profile data
                 if user_id in conversation_manager.user_profiles:
-                    profile_success = await self.save_user_profile_data(
-                        user_id, conversation_manager.user_profiles[user_id])
-                    success = success and profile_success
+                    tasks.append(self.save_user_profile_data(
+                        user_id, conversation_manager.user_profiles[user_id]))
         
         # Save DM settings
-        dm_success = await self.save_dm_settings(emotion_manager.dm_enabled_users)
-        success = success and dm_success
+        tasks.append(self.save_dm_settings(emotion_manager.dm_enabled_users))
+        
+        # Run all saves concurrently; file writes are bounded by io_semaphore.
+        # Files whose content hasn't changed are skipped by save_file.
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error saving data: {result}")
+        success = all(result is True for result in results)
         
         print(f"Data save complete for {len(emotion_manager.user_emotions)} users")
         return success
@@ -311,112 +486,49 @@ class StorageManager:
         
         print("Beginning data load process...")
         
-        # Load profile data
-        profile_count = 0
-        error_count = 0
-        for file in self.profiles_dir.glob("*.json"):
-            if "_" not in file.stem:  # Skip special files like _memories.json
-                try:
-                    uid = int(file.stem)
-                    file_content = file.read_text(encoding="utf-8")
-                    if not file_content.strip():
-                        print(f"Warning: Empty file {file}")
-                        continue
-                        
-                    data = json.loads(file_content)
-                    emotion_manager.user_emotions[uid] = data
-                    
-                    # Extract relationship data if present
-                    if "relationship" in data:
-                        emotion_manager.relationship_progress[uid] = data.get("relationship", {})
-                    
-                    # Extract interaction stats if present
-                    if "interaction_stats" in data:
-                        emotion_manager.interaction_stats[uid] = Counter(data.get("interaction_stats", {}))
-                        
-                    profile_count += 1
-                except Exception as e:
-                    error_count += 1
-                    print(f"Error loading profile {file}: {e}")
+        def assign_profile(uid, data):
+            emotion_manager.user_emotions[uid] = data
+            
+            # Extract relationship data if present
+            if "relationship" in data:
+                emotion_manager.relationship_progress[uid] = data.get("relationship", {})
+            
+            # Extract interaction stats if present
+            if "interaction_stats" in data:
+                emotion_manager.interaction_stats[uid] = Counter(data.get("interaction_stats", {}))
         
-        print(f"Loaded {profile_count} profiles with {error_count} errors")
+        def assign_user_profile(uid, data):
+            conversation_manager.user_profiles[uid] = UserProfile.from_dict(data)
         
-        # Load memories data
-        memory_count = 0
-        for file in self.profiles_dir.glob("*_memories.json"):
-            try:
-                uid = int(file.stem.split("_")[0])
-                file_content = file.read_text(encoding="utf-8")
-                if file_content.strip():
-                    emotion_manager.user_memories[uid] = json.loads(file_content)
-                    memory_count += 1
-            except Exception as e:
-                print(f"Error loading memories {file}: {e}")
+        def assign_conversation(uid, data):
+            conversation_manager.conversations[uid] = deque(data, maxlen=conversation_manager.MAX_HISTORY)
         
-        # Load events data
-        events_count = 0
-        for file in self.profiles_dir.glob("*_events.json"):
-            try:
-                uid = int(file.stem.split("_")[0])
-                file_content = file.read_text(encoding="utf-8")
-                if file_content.strip():
-                    emotion_manager.user_events[uid] = json.loads(file_content)
-                    events_count += 1
-            except Exception as e:
-                print(f"Error loading events {file}: {e}")
+        def assign_summary(uid, data):
+            conversation_manager.conversation_summaries[uid] = data.get("summary", "")
+            self.remember_summary_time(uid, data)
         
-        # Load milestones data
-        milestones_count = 0
-        for file in self.profiles_dir.glob("*_milestones.json"):
-            try:
-                uid = int(file.stem.split("_")[0])
-                file_content = file.read_text(encoding="utf-8")
-                if file_content.strip():
-                    emotion_manager.user_milestones[uid] = json.loads(file_content)
-                    milestones_count += 1
-            except Exception as e:
-                print(f"Error loading milestones {file}: {e}")
+        # Load every kind of data file concurrently
+        ((profile_count, error_count), (memory_count, _), (events_count, _), (milestones_count, _),
+         (user_profile_count, _), (conversation_count, _), (summary_count, _)) = await asyncio.gather(
+            # Special files like _memories.json are skipped here
+            self.load_bucket([e for e in json_entries(self.profiles_dir, ".json") if "_" not in e.name],
+                             assign_profile, "profile"),
+            self.load_bucket(json_entries(self.profiles_dir, "_memories.json"),
+                             emotion_manager.user_memories.__setitem__, "memories"),
+            self.load_bucket(json_entries(self.profiles_dir, "_events.json"),
+                             emotion_manager.user_events.__setitem__, "events"),
+            self.load_bucket(json_entries(self.profiles_dir, "_milestones.json"),
+                             emotion_manager.user_milestones.__setitem__, "milestones"),
+            self.load_bucket(json_entries(self.user_profiles_dir, "_profile.json"),
+                             assign_user_profile, "user profile"),
+            self.load_bucket(json_entries(self.conversations_dir, "_conversations.json"),
+                             assign_conversation, "conversation"),
+            self.load_bucket(json_entries(self.conversations_dir, "_summary.json"),
+                             assign_summary, "conversation summary")
+        )
         
-        # Load user profiles
-        profile_count = 0
-        for file in self.user_profiles_dir.glob("*_profile.json"):
-            try:
-                uid = int(file.stem.split("_")[0])
-                file_content = file.read_text(encoding="utf-8")
-                if file_content.strip():
-                    data = json.loads(file_content)
-                    profile = conversation_manager.user_profiles[uid].__class__.from_dict(data)
-                    conversation_manager.user_profiles[uid] = profile
-                    profile_count += 1
-            except Exception as e:
-                print(f"Error loading user profile {file}: {e}")
-        print(f"Loaded {profile_count} user profiles")
-
-        # Load conversation data
-        conversation_count = 0
-        for file in self.conversations_dir.glob("*_conversations.json"):
-            try:
-                uid = int(file.stem.split("_")[0])
-                file_content = file.read_text(encoding="utf-8")
-                if file_content.strip():
-                    conversation_manager.conversations[uid] = json.loads(file_content)
-                    conversation_count += 1
-            except Exception as e:
-                print(f"Error loading conversation {file}: {e}")
-
-        # Load conversation summaries
-        summary_count = 0
-        for file in self.conversations_dir.glob("*_summary.json"):
-            try:
-                uid = int(file.stem.split("_")[0])
-                file_content = file.read_text(encoding="utf-8")
-                if file_content.strip():
-                    data = json.loads(file_content)
-                    conversation_manager.conversation_summaries[uid] = data.get("summary", "")
-                    summary_count += 1
-            except Exception as e:
-                print(f"Error loading conversation summary {file}: {e}")
-
+        print(f"Loaded {profile_count} profiles with {error_count} errors")
+        print(f"Loaded {user_profile_count} user profiles")
         print(f"Loaded {conversation_count} conversations and {summary_count} summaries")
 
         print(f"Loaded {memory_count} memory files, {events_count} event files, {milestones_count} milestone files")
@@ -425,10 +537,10 @@ class StorageManager:
         for uid in emotion_manager.user_emotions:
             if "first_interaction" not in emotion_manager.user_emotions[uid]:
                 emotion_manager.user_emotions[uid]["first_interaction"] = emotion_manager.user_emotions[uid].get(
-                    "last_interaction", datetime.now(timezone.utc).isoformat())
+                    "last_interaction", utcnow_iso())
         
         # Load DM settings
         emotion_manager.dm_enabled_users = await self.load_dm_settings()
         
         print("Data load complete")
-        return profile_count > 0  # Return success indicator
+        return user_profile_count > 0  # Return success indicator
@@ -1,66 +1,168 @@
 """
 User profile model for the A2 Discord bot.
 """
-from datetime import datetime, timezone
+import sys
+from itertools import islice
+
+from models.utils import utcnow_iso
 
 class UserProfile:
     """Stores detailed information about users that A2 interacts with"""
     
-    def __init__(self, user_id):
-        self.user_id = user_id
-        self.name = None
-        self.nickname = None
-        self.preferred_name = None
-        self.personality_traits = []
-        self.interests = []
-        self.notable_facts = []
-        self.relationship_context = []
-        self.conversation_topics = []
-        self.created_at = datetime.now(timezone.utc).isoformat()
-        self.updated_at = datetime.now(timezone.utc).isoformat()
+    # Stored fields, in serialization order
+    _FIELDS = (
+        'user_id', 'name', 'nickname', 'preferred_name', 'personality_traits', 'interests',
+        'notable_facts', 'relationship_context', 'conversation_topics', 'created_at', 'updated_at'
+    )
+    
+    # Fields holding lists. They start out as a shared empty tuple and are
+    # only given a list of their own by append_to.
+    _LIST_FIELDS = frozenset((
+        'personality_traits', 'interests', 'notable_facts', 'relationship_context', 'conversation_topics'
+    ))
+    
+    # Fixed attribute layout: no per-instance __dict__. updated_at is a property
+    # backed by _updated_at; _summary caches get_summary until updated_at is set.
+    __slots__ = tuple(f for f in _FIELDS if f != 'updated_at') + ('_updated_at', '_summary')
+    
+    # (label, separator, field, max items) for each list section of get_summary
+    _SUMMARY_SPECS = (
+        ('Personality', ', ', 'personality_traits', 3),
+        ('Interests', ', ', 'interests', 3),
+        ('Notable facts', '; ', 'notable_facts', 2),
+        ('Relationship context', '; ', 'relationship_context', 2)
+    )
+    
+    # Fields that update_profile may change
+    _ALLOWED_FIELDS = frozenset(_FIELDS) - {'user_id', 'created_at', 'updated_at'}
+    
+    # __init__, to_dict and from_dict are generated by _generate_methods below
+    
+    @property
+    def updated_at(self):
+        """When the profile was last changed"""
+        return self._updated_at
+    
+    @updated_at.setter
+    def updated_at(self, value):
+        # Every recorded change may affect the summary
+        self._updated_at = value
+        self._summary = None
     
     def update_profile(self, field, value):
         """Update a specific field in the profile"""
-        if hasattr(self, field):
+        # Field names in _FIELDS are interned literals; interning the argument
+        # lets the lookups below match on identity
+        field = sys.intern(field)
+        if field in self._ALLOWED_FIELDS:
+            # Nothing to do if the value is unchanged; keep updated_at as is
+            if getattr(self, field) == value:
+                return True
             setattr(self, field, value)
-            self.updated_at = datetime.now(timezone.utc).isoformat()
+            self.updated_at = utcnow_iso()
             return True
         return False
     
-    def to_dict(self):
-        """Convert profile to dictionary for storage"""
-        return {k: v for k, v in self.__dict__.items()}
-    
-    @classmethod
-    def from_dict(cls, data):
-        """Create profile from dictionary"""
-        profile = cls(data.get('user_id'))
-        for k, v in data.items():
-            if hasattr(profile, k):
-                setattr(profile, k, v)
-        return profile
+    def append_to(self, field, value):
+        """Append a value to one of the list fields"""
+        values = getattr(self, field)
+        if not isinstance(values, list):
+            values = list(values)
+            setattr(self, field, values)
+        values.append(value)
+        self._summary = None
     
     def get_summary(self):
-        """Generate a human-readable summary of the profile"""
-        summary = []
+        """Generate a human-readable summary of the profile.
+        
+        The result is cached until updated_at is next assigned, so code that
+        modifies fields directly must also refresh updated_at.
+        """
+        if self._summary is not None:
+            return self._summary
+        
+        name = self.preferred_name or self.nickname or self.name
+        name_seg = f"Name: {name}" if name else None
+        
+        # Common case for new profiles: nothing beyond the name to join
+        if not (self.personality_traits or self.interests or self.notable_facts or self.relationship_context):
+            self._summary = name_seg or ""
+            return self._summary
         
-        if self.preferred_name:
-            summary.append(f"Name: {self.preferred_name}")
-        elif self.nickname:
-            summary.append(f"Name: {self.nickname}")
-        elif self.name:
-            summary.append(f"Name: {self.name}")
-            
-        if self.personality_traits:
-            summary.append(f"Personality: {', '.join(self.personality_traits[:3])}")
-            
-        if self.interests:
-            summary.append(f"Interests: {', '.join(self.interests[:3])}")
-            
-        if self.notable_facts:
-            summary.append(f"Notable facts: {'; '.join(self.notable_facts[:2])}")
-            
-        if self.relationship_context:
-            summary.append(f"Relationship context: {'; '.join(self.relationship_context[:2])}")
-            
-        return " | ".join(summary)
+        persona_seg, interests_seg, facts_seg, rel_seg = (
+            self._format_section(*spec) for spec in self._SUMMARY_SPECS
+        )
+        self._summary = " | ".join(
+            seg for seg in (name_seg, persona_seg, interests_seg, facts_seg, rel_seg) if seg
+        )
+        return self._summary
+    
+    def _format_section(self, label, sep, field, limit):
+        """Format one list section of the summary, or None if the list is empty"""
+        values = getattr(self, field)
+        if values:
+            return f"{label}: {sep.join(islice(values, limit))}"
+        return None
+
+def _generate_methods(cls):
+    """Compile straight-line __init__, to_dict and from_dict for the fixed fields.
+    
+    Generating the code once avoids looping over field names on every call,
+    the same approach dataclasses and attrs take.
+    """
+    data_fields = [f for f in cls._FIELDS if f not in ('user_id', 'created_at', 'updated_at')]
+    
+    def default(field):
+        return '()' if field in cls._LIST_FIELDS else 'None'
+    
+    def stored(field):
+        # Empty list fields are stored as None
+        return f'self.{field} or None' if field in cls._LIST_FIELDS else f'self.{field}'
+    
+    def loaded(field):
+        # List fields stored as None, or missing, load as the shared empty tuple
+        if field in cls._LIST_FIELDS:
+            return f'data.get({field!r}) or ()'
+        return f'data.get({field!r})'
+    
+    init_lines = [
+        'def __init__(self, user_id):',
+        '    self.user_id = user_id',
+        *(f'    self.{f} = {default(f)}' for f in data_fields),
+        '    ts = utcnow_iso()',
+        '    self.created_at = ts',
+        '    self.updated_at = ts',
+    ]
+    
+    to_dict_lines = [
+        'def to_dict(self):',
+        '    """Convert profile to dictionary for storage"""',
+        '    return {' + ', '.join(f'{f!r}: {stored(f)}' for f in cls._FIELDS) + '}',
+    ]
+    
+    # Assign fields directly rather than running __init__, whose timestamps would
+    # only be overwritten by the stored ones. Data saved without timestamps gets
+    # fresh ones, as from __init__.
+    from_dict_lines = [
+        'def from_dict(data):',
+        '    """Create profile from dictionary"""',
+        f'    profile = {cls.__name__}.__new__({cls.__name__})',
+        "    profile.user_id = data.get('user_id')",
+        *(f'    profile.{f} = {loaded(f)}' for f in data_fields),
+        "    ts = None if 'created_at' in data and 'updated_at' in data else utcnow_iso()",
+        "    profile.created_at = data['created_at'] if 'created_at' in data else ts",
+        "    profile.updated_at = data['updated_at'] if 'updated_at' in data else ts",
+        '    return profile',
+    ]
+    
+    namespace = {}
+    source = '\n'.join(init_lines + [''] + to_dict_lines + [''] + from_dict_lines)
+    exec(compile(source, f'<generated {cls.__name__} methods>', 'exec'), globals(), namespace)
+    
+    for name in ('__init__', 'to_dict', 'from_dict'):
+        namespace[name].__qualname__ = f'{cls.__name__}.{name}'
+    cls.__init__ = namespace['__init__']
+    cls.to_dict = namespace['to_dict']
+    cls.from_dict = staticmethod(namespace['from_dict'])
+
+_generate_methods(UserProfile)
@@ -0,0 +1,16 @@
+"""
+Shared helpers for the A2 Discord bot models.
+"""
+import time
+from datetime import datetime, timezone
+
+# Last formatted timestamp: [time.time() it was taken, ISO string]
+_ts_cache = [0.0, ""]
+
+def utcnow_iso():
+    """Current UTC time as an ISO string, reused for up to a quarter second"""
+    now = time.time()
+    if not 0 <= now - _ts_cache[0] <= 0.25:
+        _ts_cache[0] = now
+        _ts_cache[1] = datetime.fromtimestamp(now, timezone.utc).isoformat()
+    return _ts_cache[1]
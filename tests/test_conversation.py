@@ -0,0 +1,77 @@
+"""
+Tests for the conversation manager.
+"""
+import re
+import unittest
+
+from models.managers.conversation import PERSONALITY_TRAITS, ConversationManager, find_traits
+
+# The per-pattern regexes find_traits replaced
+BASELINE_TRAIT_PATTERNS = (
+    r"I am (?:quite |very |extremely |really |)(\w+)",
+    r"I'm (?:quite |very |extremely |really |)(\w+)",
+    r"I consider myself (?:quite |very |extremely |really |)(\w+)"
+)
+
+
+def baseline_traits(message_content):
+    traits = set()
+    for pattern in BASELINE_TRAIT_PATTERNS:
+        for match in re.finditer(pattern, message_content, re.I):
+            trait = match.group(1).strip().lower()
+            if trait in PERSONALITY_TRAITS:
+                traits.add(trait)
+    return traits
+
+
+class FindTraitsTests(unittest.TestCase):
+
+    def test_matches_baseline_extraction(self):
+        messages = (
+            "I am shy",
+            "She said 'I am shy'",
+            "I'm shy'",
+            "'I'm curious', I said",
+            "\"I am very anxious\" and I'm really creative.",
+            "I consider myself extremely logical",
+            "I'm quite-shy",
+            "I'm not shy",
+            "I am a very cautious driver",
+            "I AM RESILIENT",
+        )
+        for message in messages:
+            with self.subTest(message=message):
+                self.assertEqual(set(find_traits(message.lower())), baseline_traits(message))
+
+    def test_hyphenated_words_are_kept_whole(self):
+        self.assertEqual(list(find_traits("i'm really laid-back")), ["laid-back"])
+        self.assertEqual(list(find_traits("'i am laid-back'")), ["laid-back"])
+        # The baseline matched the "hardworking" prefix of this word
+        self.assertEqual(list(find_traits("well i'm hardworking-ish")), [])
+
+    def test_quoted_trait(self):
+        # The baseline needed a space right before the trait
+        self.assertEqual(list(find_traits("i consider myself 'organized'")), ["organized"])
+
+
+class ExtractNameTests(unittest.TestCase):
+
+    def extract(self, message_content):
+        profile = ConversationManager().extract_profile_info(1, message_content)
+        return profile.name, profile.nickname
+
+    def test_later_pattern_takes_precedence(self):
+        self.assertEqual(self.extract("I go by Sam. My name is Samuel"), ("Sam", None))
+        self.assertEqual(self.extract("My name is Samuel. I go by Sam"), ("Sam", None))
+
+    def test_first_match_of_each_pattern_counts(self):
+        self.assertEqual(self.extract("call me X. call me Y"), (None, "X"))
+        self.assertEqual(self.extract("My name is Bob. My name is Robert"), ("Bob", None))
+
+    def test_call_me_gives_nickname(self):
+        self.assertEqual(self.extract("My name is Bob, call me Bobby"), ("Bob", "Bobby"))
+        self.assertEqual(self.extract("My nickname? I go by Ace"), (None, "Ace"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+"""
+Tests for the storage manager.
+"""
+import asyncio
+import errno
+import json
+import os
+import stat
+import tempfile
+import unittest
+from collections import Counter, defaultdict
+from pathlib import Path
+from unittest import mock
+
+from models.managers import storage
+from models.managers.conversation import ConversationManager
+from models.managers.storage import StorageManager
+
+
+class FakeEmotionManager:
+    """Minimal stand-in for the emotion manager's persisted state"""
+
+    def __init__(self):
+        self.user_emotions = {}
+        self.user_memories = defaultdict(list)
+        self.user_events = defaultdict(list)
+        self.user_milestones = defaultdict(list)
+        self.interaction_stats = defaultdict(Counter)
+        self.relationship_progress = defaultdict(dict)
+        self.dm_enabled_users = set()
+
+
+class SaveDataTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        users = root / "users"
+        self.storage = StorageManager(
+            root, users, users / "profiles", users / "dm_settings.json",
+            users / "user_profiles", users / "conversations")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_failed_conversation_write_is_retried(self):
+        emotion_manager = FakeEmotionManager()
+        emotion_manager.user_emotions[1] = {}
+        conversation_manager = ConversationManager()
+        conversation_manager.add_message(1, "one")
+        conv_path = self.storage.conversations_dir / "1_conversations.json"
+
+        with mock.patch("sys.stdout"):
+            self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+            conversation_manager.add_message(1, "two")
+
+            write_atomic = storage.write_atomic
+
+            def failing_write(path, *args):
+                if path.parent == self.storage.conversations_dir:
+                    raise OSError(errno.ENOSPC, "No space left on device")
+                return write_atomic(path, *args)
+
+            with mock.patch.object(storage, "write_atomic", failing_write):
+                self.assertFalse(await self.storage.save_data(emotion_manager, conversation_manager))
+
+            self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+
+        contents = [msg["content"] for msg in json.loads(conv_path.read_text(encoding="utf-8"))]
+        self.assertEqual(contents, ["one", "two"])
+
+    async def test_profile_changed_through_reference_is_saved(self):
+        emotion_manager = FakeEmotionManager()
+        emotion_manager.user_emotions[1] = {}
+        conversation_manager = ConversationManager()
+        conversation_manager.add_message(1, "one")
+        profile = conversation_manager.get_or_create_profile(1)
+        profile_path = self.storage.user_profiles_dir / "1_profile.json"
+
+        with mock.patch("sys.stdout"):
+            self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+            profile.append_to("interests", "chess")
+            conversation_manager.user_profiles[1].update_profile("nickname", "Ace")
+            self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+
+        data = json.loads(profile_path.read_text(encoding="utf-8"))
+        self.assertEqual((data["interests"], data["nickname"]), (["chess"], "Ace"))
+
+    async def test_unchanged_summary_is_not_rewritten(self):
+        emotion_manager = FakeEmotionManager()
+        emotion_manager.user_emotions[1] = {}
+        conversation_manager = ConversationManager()
+        conversation_manager.add_message(1, "one")
+        conversation_manager.conversation_summaries[1] = "first"
+        summary_path = self.storage.conversations_dir / "1_summary.json"
+        written = []
+        write_atomic = storage.write_atomic
+
+        def recording_write(path, *args):
+            written.append(path)
+            return write_atomic(path, *args)
+
+        with mock.patch("sys.stdout"), mock.patch.object(storage, "write_atomic", recording_write):
+            self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+            first = json.loads(summary_path.read_text(encoding="utf-8"))
+            written.clear()
+            self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+            self.assertEqual(written, [])
+
+            conversation_manager.conversation_summaries[1] = "second"
+            with mock.patch.object(storage, "utcnow_iso", return_value="later"):
+                self.assertTrue(await self.storage.save_data(emotion_manager, conversation_manager))
+
+        self.assertEqual(written, [summary_path])
+        self.assertEqual(json.loads(summary_path.read_text(encoding="utf-8")),
+                         {"summary": "second", "updated_at": "later"})
+        self.assertNotEqual(first["updated_at"], "later")
+
+    async def test_concurrent_saves_of_one_path(self):
+        path = self.storage.data_dir / "settings.json"
+        with mock.patch("sys.stdout"):
+            results = await asyncio.gather(*(
+                self.storage.save_file(path, {"value": i}) for i in range(8)))
+
+        self.assertEqual(results, [True] * 8)
+        self.assertIn(json.loads(path.read_text(encoding="utf-8"))["value"], range(8))
+        self.assertEqual([p.name for p in self.storage.data_dir.iterdir() if p.is_file()], ["settings.json"])
+
+    @unittest.skipIf(os.name == "nt", "POSIX file modes")
+    async def test_saved_file_mode_follows_umask(self):
+        path = self.storage.data_dir / "settings.json"
+        old_umask = os.umask(0o077)
+        try:
+            self.assertTrue(await self.storage.save_file(path, {"value": 1}))
+        finally:
+            os.umask(old_umask)
+
+        self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+
+    async def test_unchanged_save_rewrites_deleted_file(self):
+        path = self.storage.data_dir / "settings.json"
+        self.assertTrue(await self.storage.save_file(path, {"value": 1}))
+        path.unlink()
+
+        self.assertTrue(await self.storage.save_file(path, {"value": 1}))
+        self.assertEqual(json.loads(path.read_text(encoding="utf-8")), {"value": 1})
+
+    async def test_reload_sees_external_edit(self):
+        path = self.storage.data_dir / "settings.json"
+        self.assertTrue(await self.storage.save_file(path, {"value": 1}))
+        self.assertEqual(json.loads(self.storage.read_data_file(path)), {"value": 1})
+
+        path.write_text('{"value": 22}', encoding="utf-8")
+        self.assertEqual(json.loads(self.storage.read_data_file(path)), {"value": 22})
+
+    async def test_written_files_mirror_is_bounded(self):
+        for i in range(storage.MIRRORED_FILES + 10):
+            self.assertTrue(await self.storage.save_file(self.storage.data_dir / f"{i}.json", {"value": i}))
+
+        self.assertEqual(len(self.storage.written_files), storage.MIRRORED_FILES)
+        self.assertNotIn(self.storage.data_dir / "0.json", self.storage.written_files)
+        self.assertEqual(json.loads(self.storage.read_data_file(self.storage.data_dir / "0.json")), {"value": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests for the user profile model.
+"""
+import unittest
+
+from models.user_profile import UserProfile
+
+
+class SerializationTests(unittest.TestCase):
+
+    def test_round_trip_with_empty_list_fields(self):
+        profile = UserProfile(1)
+        profile.name = "Bob"
+        data = profile.to_dict()
+
+        self.assertEqual(list(data), list(UserProfile._FIELDS))
+        for field in UserProfile._LIST_FIELDS:
+            self.assertIsNone(data[field])
+
+        loaded = UserProfile.from_dict(data)
+        self.assertEqual(loaded.to_dict(), data)
+        self.assertEqual(loaded.interests, ())
+        self.assertEqual((loaded.created_at, loaded.updated_at), (profile.created_at, profile.updated_at))
+
+    def test_round_trip_with_filled_list_fields(self):
+        profile = UserProfile(1)
+        for field in UserProfile._LIST_FIELDS:
+            profile.append_to(field, f"{field} one")
+            profile.append_to(field, f"{field} two")
+        data = profile.to_dict()
+
+        self.assertEqual(data["interests"], ["interests one", "interests two"])
+        loaded = UserProfile.from_dict(data)
+        self.assertEqual(loaded.to_dict(), data)
+
+        # Loaded lists can still be appended to
+        loaded.append_to("interests", "interests three")
+        self.assertEqual(len(loaded.interests), 3)
+
+    def test_loads_legacy_empty_lists(self):
+        loaded = UserProfile.from_dict({
+            "user_id": 1, "name": "Bob", "interests": [], "personality_traits": [],
+            "created_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-02T00:00:00+00:00",
+        })
+
+        self.assertEqual(loaded.interests, ())
+        self.assertEqual(loaded.conversation_topics, ())
+        self.assertIsNone(loaded.to_dict()["interests"])
+        self.assertEqual(loaded.created_at, "2024-01-01T00:00:00+00:00")
+        self.assertEqual(loaded.updated_at, "2024-01-02T00:00:00+00:00")
+
+    def test_missing_timestamps_get_fresh_ones(self):
+        loaded = UserProfile.from_dict({"user_id": 1})
+        self.assertIsNotNone(loaded.created_at)
+        self.assertEqual(loaded.created_at, loaded.updated_at)
+
+        loaded = UserProfile.from_dict({"user_id": 1, "created_at": "2024-01-01T00:00:00+00:00"})
+        self.assertEqual(loaded.created_at, "2024-01-01T00:00:00+00:00")
+        self.assertNotEqual(loaded.updated_at, "2024-01-01T00:00:00+00:00")
+        self.assertIsNotNone(loaded.updated_at)
+
+
+class SummaryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = UserProfile(1)
+        self.profile.name = "Bob"
+        self.assertEqual(self.profile.get_summary(), "Name: Bob")
+
+    def test_update_profile_invalidates(self):
+        self.assertTrue(self.profile.update_profile("nickname", "Bobby"))
+        self.assertEqual(self.profile.get_summary(), "Name: Bobby")
+
+    def test_append_to_invalidates(self):
+        self.profile.append_to("interests", "chess")
+        self.assertEqual(self.profile.get_summary(), "Name: Bob | Interests: chess")
+
+    def test_setting_updated_at_invalidates(self):
+        self.profile.name = "Robert"
+        self.assertEqual(self.profile.get_summary(), "Name: Bob")
+        self.profile.updated_at = "2024-01-01T00:00:00+00:00"
+        self.assertEqual(self.profile.get_summary(), "Name: Robert")
+
+    def test_summary_limits_list_sections(self):
+        for interest in ("a", "b", "c", "d"):
+            self.profile.append_to("interests", interest)
+        for fact in ("x", "y", "z"):
+            self.profile.append_to("notable_facts", fact)
+        self.assertEqual(self.profile.get_summary(), "Name: Bob | Interests: a, b, c | Notable facts: x; y")
+
+
+class UpdateProfileTests(unittest.TestCase):
+
+    def test_refuses_protected_fields(self):
+        profile = UserProfile(1)
+        before = profile.to_dict()
+        for field in ("user_id", "created_at", "updated_at"):
+            with self.subTest(field=field):
+                self.assertFalse(profile.update_profile(field, "changed"))
+        self.assertFalse(profile.update_profile("no_such_field", "changed"))
+        self.assertEqual(profile.to_dict(), before)
+
+    def test_updates_allowed_field(self):
+        profile = UserProfile(1)
+        profile.updated_at = "2024-01-01T00:00:00+00:00"
+        self.assertTrue(profile.update_profile("name", "Bob"))
+        self.assertEqual(profile.name, "Bob")
+        self.assertNotEqual(profile.updated_at, "2024-01-01T00:00:00+00:00")
+
+    def test_unchanged_value_keeps_updated_at(self):
+        profile = UserProfile(1)
+        profile.update_profile("name", "Bob")
+        profile.updated_at = "2024-01-01T00:00:00+00:00"
+        self.assertTrue(profile.update_profile("name", "Bob"))
+        self.assertEqual(profile.updated_at, "2024-01-01T00:00:00+00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()